@@ -1,14 +1,20 @@
 # Environment variables
 from dotenv import load_dotenv
 import os
+import logging
 load_dotenv()
 
 # Utilities
 from typing import List, Dict, TypedDict, Literal
 from typing_extensions import TypedDict, Annotated
-import json
+import orjson
 import operator
-from utils import remove_json_blocks
+import asyncio
+import atexit
+import functools
+from collections import Counter
+from utils import remove_json_blocks, canonical_url, icp_keywords, prefilter_results
+from cache import SemanticCache, PersistentLLMCache, PageCache
 from concurrent.futures import ThreadPoolExecutor
 
 # Langchain
@@ -17,27 +23,152 @@ from langchain.chat_models import init_chat_model
 from langchain_core.messages import AnyMessage
 from langchain_core.messages import SystemMessage
 from langchain_core.messages import HumanMessage
-from langchain_core.runnables import RunnableParallel
+from langchain_core.runnables import RunnableLambda
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.globals import set_llm_cache
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
     
+# Output schemas
+from schemas import Strategy, Prospect, CompanyList, ProspectRecommendations, validate_items
+
 # Tools
 from tools import google_search_tool, scrape_webpage_tool, parse_linkedin_search_results
 
 # Prompts
-from prompts import generate_icp_prompt, strategy_selection_prompt, generate_company_queries_prompt, filter_search_results_prompt, parse_results_prompt, personalization_prompt, parse_companies_prompt, generate_person_queries_prompt
-
-llm = init_chat_model(
-    "gemini-2.5-flash-lite",
-    model_provider='google_genai',
-    temperature=0
-)
+from prompts import generate_icp_prompt, strategy_selection_prompt, icp_summary_prompt, generate_company_queries_prompt, filter_search_results_prompt, parse_results_prompt, personalization_batch_prompt, parse_companies_prompt, generate_person_queries_prompt
+
+# Progress messages go through logging: the arguments of a disabled level are never formatted,
+# and the bulky ones (ICP, search results, prospects) are only logged at DEBUG
+log = logging.getLogger("kvasir.agent")
+
+# Directory of the on-disk caches
+CACHE_DIR = ".cache"
+
+# The model runs at temperature=0, so identical prompts give identical answers.
+# A global exact-match cache (keyed on the prompt and the model parameters) lets retries
+# and repeated runs skip the round-trip entirely. It is checked before any semantic cache.
+set_llm_cache(PersistentLLMCache(os.path.join(CACHE_DIR, "llm_cache.db")))
+
+# The Gemini client (credentials, HTTP/gRPC transport) is only created on first use,
+# and then shared by every node.
+@functools.lru_cache(maxsize=1)
+def get_llm():
+    """Returns the shared chat model."""
+    return init_chat_model(
+        "gemini-2.5-flash-lite",
+        model_provider='google_genai',
+        temperature=0
+    )
+
+# Number of candidate answers sampled for the strategy selection
+STRATEGY_SAMPLES = 3
+
+@functools.lru_cache(maxsize=1)
+def get_strategy_llm():
+    """
+    Returns the chat model used to sample strategies: one request returns STRATEGY_SAMPLES
+    candidates (Gemini candidate_count). It needs a non-zero temperature, at temperature=0
+    the candidates would all be the same answer.
+    """
+    return init_chat_model(
+        "gemini-2.5-flash-lite",
+        model_provider='google_genai',
+        temperature=0.7,
+        n=STRATEGY_SAMPLES
+    )
+
+def _parse_json(message):
+    """
+    Strips the markdown code fences of a model answer and parses its JSON strictly:
+    a truncated answer raises OutputParserException instead of giving a half-written item.
+    """
+    text = remove_json_blocks(message.content)
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError as e:
+        raise OutputParserException(f"Invalid JSON output: {e}", llm_output=text) from e
+
+# Output parser of the JSON-emitting chains, the answers are then checked against schemas.py
+json_parser = RunnableLambda(_parse_json)
+
+# Semantic caches, persisted between runs. They are keyed on the single input that drives the
+# answer (not the whole rendered prompt, which is mostly template text) and are only used where
+# a paraphrased input should get the same answer: the ICP (keyed on the product context) and
+# the strategy selection (keyed on the ICP). Constraint-sensitive nodes (query generation on
+# retry, filtering, parsing, personalization) keep using the exact-match cache.
+@functools.lru_cache(maxsize=1)
+def get_embeddings():
+    """Returns the shared embeddings client used by the semantic caches."""
+    return GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+
+@functools.lru_cache(maxsize=1)
+def get_icp_cache():
+    """Returns the ICP semantic cache, keyed on the product context."""
+    return SemanticCache(get_embeddings(), threshold=0.9, path=os.path.join(CACHE_DIR, "icp_cache.json"))
+
+@functools.lru_cache(maxsize=1)
+def get_strategy_cache():
+    """Returns the strategy selection semantic cache, keyed on the ICP."""
+    return SemanticCache(get_embeddings(), threshold=0.92, path=os.path.join(CACHE_DIR, "strategy_cache.json"))
+
+# One thread pool shared by every node for the blocking tool calls (Google search, LinkedIn parsing).
+# Its size is a constant rather than derived from the CPU count: the work is network-bound.
+THREAD_POOL_SIZE = 16
+_POOL = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="kvasir")
+atexit.register(_POOL.shutdown, wait=True)
+
+async def _run_blocking(func, *args):
+    """Runs a blocking call on the shared thread pool without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_POOL, func, *args)
+
+# Maximum number of Google searches running at the same time
+MAX_SEARCH_WORKERS = 10
+# Maximum number of personalization prompts running at the same time
+MAX_PERSONALIZATION_WORKERS = 8
+# Number of prospects written for in each personalization prompt
+PERSONALIZATION_BATCH_SIZE = 8
+# Maximum number of pages scraped at the same time
+MAX_SCRAPE_CONCURRENCY = 32
+# Number of search results sent to the LLM in each filtering prompt
+FILTER_CHUNK_SIZE = 20
+# Maximum number of filtering prompts running at the same time
+MAX_FILTER_WORKERS = 6
+# Maximum number of scraped pages kept in memory
+SCRAPE_CACHE_SIZE = 1024
+# Number of seconds a scraped page is reused before being fetched again
+SCRAPE_CACHE_TTL = 24 * 3600
+
+@functools.lru_cache(maxsize=1)
+def get_page_cache():
+    """Returns the scraped pages cache, shared by every run and kept on disk between runs."""
+    return PageCache(os.path.join(CACHE_DIR, "page_cache.db"), ttl=SCRAPE_CACHE_TTL, max_memory_entries=SCRAPE_CACHE_SIZE)
+
+async def _scrape_cached(url: str) -> str:
+    """Scrapes a URL with scrape_webpage_tool, reusing the content of recent successful scrapes."""
+    # Tracking parameters do not change the page, they must not defeat the cache
+    cache_key = canonical_url(url)
+    page_cache = get_page_cache()
+    content = page_cache.get(cache_key)
+    if content is not None:
+        return content
+
+    # The tool has a native async implementation, it does not need a pool thread
+    content = await scrape_webpage_tool.ainvoke({"url": url})
+    # Failures are not cached, the page may be reachable on the next run
+    if "Error fetching URL" not in content:
+        page_cache.set(cache_key, content)
+    return content
 
 class AgentState(TypedDict):
     product_context: str
     icp: Dict  # Ideal Customer Profile
+    icp_summary: str  # Compact ICP used as context by the token-heavy nodes
     strategy: Dict
     search_queries: List[str]
     company_list: List[str]
     raw_search_results: List[Dict]  # Results from Google API
+    raw_search_results_json: str  # Serialized filtered results, shared by the parsing nodes
     prospects: List[Dict]  # Structured prospect data (name, title, company, url)
     personalized_outreach: List[Dict]  # Final output
     messages: Annotated[list[AnyMessage], operator.add]  # Add messages to your state
@@ -47,188 +178,275 @@ class AgentState(TypedDict):
 
 
 
+def _serialized_results(state):
+    """Returns the JSON of raw_search_results, reusing the copy made by the filter node."""
+    return state.get('raw_search_results_json') or orjson.dumps(state['raw_search_results']).decode()
+
 # Noeud 1
-def generate_icp_node(state: AgentState):
+async def generate_icp_node(state: AgentState):
     """
     Takes product_context from the state and generates an Ideal Customer Profile based on that.
     """
-    print('-'*50)
-    print('\n')
-    print(state['product_context'])
-    print('\n')
-    print("--- NODE: Generating ICP Profile ---")
-    print('\n')
+    log.info("--- NODE: Generating ICP Profile ---")
+    log.debug("Product context: %s", state['product_context'])
     
+    # Reuse the ICP of a previously seen, semantically similar product context
+    icp_cache = get_icp_cache()
+    context_vector = await icp_cache.aembed(state['product_context'])
+    cached_icp = icp_cache.lookup(context_vector)
+    if cached_icp is not None:
+        log.info("--- Reusing cached ICP for a similar product context ---")
+        log.debug("ICP: %s", cached_icp)
+        return {"icp": cached_icp}
+
     # Call LLM with a prompt to create the ICP from state['product_context']
-    icp_content = llm.invoke(generate_icp_prompt.format_messages(product_context=state['product_context'])).content
+    icp_content = (await get_llm().ainvoke(generate_icp_prompt.format_messages(product_context=state['product_context']))).content
     output = remove_json_blocks(icp_content)
-    print(output)
+    icp_cache.update(context_vector, output)
+    log.debug("ICP: %s", output)
     return {"icp": output}
 
 # Noeud 2
-def strategy_selection_node(state: AgentState):
+async def _sample_strategies(inputs):
+    """Samples STRATEGY_SAMPLES strategy answers with a single generate request."""
+    messages = strategy_selection_prompt.format_messages(**inputs)
+    result = await get_strategy_llm().agenerate([messages])
+    return [generation.message for generation in result.generations[0]]
+
+async def _summarize_icp(icp):
+    """
+    Writes the compact ICP summary. It is optional (the filter falls back to the full ICP),
+    so a failed request gives an empty summary instead of aborting the run.
+    """
+    try:
+        return (await (icp_summary_prompt | get_llm() | StrOutputParser()).ainvoke({"icp": icp})).strip()
+    except Exception as e:
+        log.warning("--- WARNING: ICP summary failed, the full ICP is used instead: %s ---", e)
+        return ""
+
+async def strategy_selection_node(state: AgentState):
     """
     Analyzes the ICP to decide on a prospecting strategy.
+    Several candidate answers are sampled in one request and the strategy is chosen by majority vote.
     """
-    print('-'*50)
-    print("\n--- NODE: Selecting Strategy ---")
+    log.info("--- NODE: Selecting Strategy ---")
     icp = state['icp']
 
-    response_content = llm.invoke(
-        strategy_selection_prompt.format_messages(icp=icp)
-    ).content
-    
-    llm_output = remove_json_blocks(response_content)
+    # The compact ICP summary only depends on the ICP: it is generated for every ICP (a cached
+    # strategy may come from a merely similar one) and runs alongside the rest of the node.
+    summary = asyncio.ensure_future(_summarize_icp(icp))
 
-    try:
-        strategy_data = json.loads(llm_output)
-        print(f"--- Strategy Selected: {strategy_data.get('strategy_name')} ---")
-        print(f"--- Rationale: {strategy_data.get('rationale')} ---")
-        return {"strategy": strategy_data}
-    except json.JSONDecodeError:
-        print(f"--- ERROR: Failed to parse strategy JSON: {response_content} ---")
-        return {"strategy": {"strategy_name": "PERSON_FIRST_LINKEDIN"}}
+    # Reuse the strategy of a previously seen, semantically similar ICP
+    strategy_cache = get_strategy_cache()
+    icp_vector = await strategy_cache.aembed(icp)
+    cached_strategy = strategy_cache.lookup(icp_vector)
+    if cached_strategy is not None:
+        log.info("--- Reusing cached strategy for a similar ICP: %s ---", cached_strategy.get('strategy_name'))
+        return {"strategy": cached_strategy, "icp_summary": await summary}
+
+    # The strategies are parsed after both calls so bad strategy answers keep the summary
+    strategies, icp_summary = await asyncio.gather(_sample_strategies({"icp": icp}), summary)
+
+    parsed = []
+    for message in strategies:
+        try:
+            parsed.append(_parse_json(message))
+        except OutputParserException as e:
+            log.error("--- ERROR: Failed to parse strategy JSON: %s ---", e.llm_output)
+    # A well-formed answer can still miss strategy_name, such answers do not get a vote
+    candidates, rejected = validate_items(Strategy, parsed)
+    if rejected:
+        log.error("--- ERROR: %d strategy answers do not match the schema ---", rejected)
+
+    if not candidates:
+        return {"strategy": {"strategy_name": "PERSON_FIRST_LINKEDIN"}, "icp_summary": icp_summary}
+
+    # Majority vote on the strategy name, keep the first candidate (and its rationale) that voted for it
+    votes = Counter(candidate['strategy_name'] for candidate in candidates)
+    winner = votes.most_common(1)[0][0]
+    strategy_data = next(candidate for candidate in candidates if candidate['strategy_name'] == winner)
+    log.info("--- Strategy Selected: %s (%d/%d votes) ---", strategy_data['strategy_name'], votes[winner], len(candidates))
+    log.info("--- Rationale: %s ---", strategy_data['rationale'])
+    strategy_cache.update(icp_vector, strategy_data)
+    return {"strategy": strategy_data, "icp_summary": icp_summary}
         
 
 # Noeud 3
-def generate_company_search_queries_node(state: AgentState):
+async def generate_company_search_queries_node(state: AgentState):
     """
     Generates search queries. If it's a retry, it uses the error_message
     to generate a different set of queries.
     """
-    print('-'*50)
-    print("\n--- NODE: Generating Queries ---")
+    log.info("--- NODE: Generating Queries ---")
 
     # Increment the attempt counter each time this node runs
     attempts = state.get('search_attempts', 0) + 1
-    print(f"--- Search Attempt: {attempts} ---")
+    log.info("--- Search Attempt: %d ---", attempts)
 
-    response_content = llm.invoke(
-        generate_company_queries_prompt.format_messages(
-            icp=state['icp'],
-            strategy_name=state['strategy']['strategy_name'],
-            product_context=state['product_context'],
-            # Pass the error message to the prompt
-            error_message=state.get('error_message', '')
-        )
-    ).content
-    llm_output = remove_json_blocks(response_content)
+    chain = generate_company_queries_prompt | get_llm() | json_parser
 
     try:
-        queries_list = json.loads(llm_output)
-        print(f"--- Successfully generated and parsed {len(queries_list)} queries. ---")
+        queries_list = await chain.ainvoke({
+            "icp": state['icp'],
+            "strategy_name": state['strategy']['strategy_name'],
+            "product_context": state['product_context'],
+            # Pass the error message to the prompt
+            "error_message": state.get('error_message', '')
+        })
+        log.info("--- Successfully generated and parsed %d queries. ---", len(queries_list))
         for query in queries_list:
-            print(query)
+            log.debug("Query: %s", query)
         
         # Update state with the new queries and the incremented attempt count
         # Also, clear the error message so it's not used in the next loop if this one succeeds
         return {"search_queries": queries_list, "search_attempts": attempts, "error_message": ""}
-    except json.JSONDecodeError:
-        print(f"--- ERROR: Failed to parse queries JSON: {response_content} ---")
+    except OutputParserException as e:
+        log.error("--- ERROR: Failed to parse queries JSON: %s ---", e.llm_output)
         return {"search_queries": [], "search_attempts": attempts}
 
 # Add this new node to parse the results
-def parse_companies_node(state: AgentState):
+async def parse_companies_node(state: AgentState):
     """Parses the raw search results to extract a list of company names."""
-    print('-'*50)
-    print("\n--- NODE: Parsing Companies from Search Results ---")
+    if not state.get('raw_search_results'):
+        return {"company_list": []}
+
+    log.info("--- NODE: Parsing Companies from Search Results ---")
     
-    response_content = llm.invoke(
-        parse_companies_prompt.format_messages(
-            icp=state['icp'],
-            raw_search_results=json.dumps(state['raw_search_results'], indent=2)
-        )
-    ).content
-    llm_output = remove_json_blocks(response_content)
+    chain = parse_companies_prompt | get_llm() | json_parser
 
     try:
-        company_data = json.loads(llm_output)
-        companies = company_data.get("companies", [])
-        print(f"--- Successfully parsed {len(companies)} company names. ---")
+        company_data = await chain.ainvoke({
+            "icp": state['icp'],
+            # Serialized once by the filter node, compact on purpose: indentation only adds prompt tokens
+            "raw_search_results": _serialized_results(state)
+        })
+        # A well-formed answer can still be a bare list or miss the companies key
+        valid, _ = validate_items(CompanyList, [company_data])
+        if not valid:
+            log.error("--- ERROR: Companies JSON does not match the schema: %s ---", company_data)
+            return {"company_list": []}
+        companies = valid[0]["companies"]
+        log.info("--- Successfully parsed %d company names. ---", len(companies))
         return {"company_list": companies}
-    except json.JSONDecodeError:
-        print(f"--- ERROR: Failed to parse companies JSON: {response_content} ---")
+    except OutputParserException as e:
+        log.error("--- ERROR: Failed to parse companies JSON: %s ---", e.llm_output)
         return {"company_list": []}
 
 # Add this new node to generate the final queries
-def generate_person_search_queries_node(state: AgentState):
+async def generate_person_search_queries_node(state: AgentState):
     """Generates targeted LinkedIn search queries for people at specific companies."""
-    print('-'*50)
-    print("\n--- NODE: Generating Person Search Queries ---")
+    log.info("--- NODE: Generating Person Search Queries ---")
 
     if not state.get('company_list'):
-        print("--- No companies found, skipping person search. ---")
+        log.info("--- No companies found, skipping person search. ---")
         return {"search_queries": []}
 
-    response_content = llm.invoke(
-        generate_person_queries_prompt.format_messages(
-            icp=state['icp'],
-            company_list=state['company_list']
-        )
-    ).content
-    llm_output = remove_json_blocks(response_content)
+    chain = generate_person_queries_prompt | get_llm() | json_parser
 
     try:
-        queries_list = json.loads(llm_output)
-        print(f"--- Successfully generated {len(queries_list)} person-specific queries. ---")
+        queries_list = await chain.ainvoke({
+            "icp": state['icp'],
+            "company_list": state['company_list']
+        })
+        log.info("--- Successfully generated %d person-specific queries. ---", len(queries_list))
         # Overwrite search_queries for the next search step
         return {"search_queries": queries_list, "search_attempts": 1} # Reset attempts for this new search phase
-    except json.JSONDecodeError:
-        print(f"--- ERROR: Failed to parse person queries JSON: {response_content} ---")
+    except OutputParserException as e:
+        log.error("--- ERROR: Failed to parse person queries JSON: %s ---", e.llm_output)
         return {"search_queries": []}
 
 
 
 # Noeud 4
-def execute_search_node(state: AgentState):
+async def execute_search_node(state: AgentState):
     """
     Takes the search_queries from the state, executes them using the
     google_search_tool, and populates the raw_search_results.
     """
-    print('-'*50)
-    print('\n')
-    print(state['search_queries'])
-    print("--- NODE: Executing Web Search ---")
-    print('\n')
+    if not state.get('search_queries'):
+        return {"raw_search_results": []}
+
+    log.info("--- NODE: Executing Web Search ---")
+    log.debug("Search queries: %s", state['search_queries'])
     search_queries = state['search_queries']
     all_results = []
+    seen_urls = set()
     
-    for query in search_queries:
-        # Call the tool for each query
-        search_results = google_search_tool.invoke({"query": query})
-        all_results.extend(search_results)
+    # Each query is an independent network round-trip, so we run them concurrently.
+    # The concurrency is capped by a constant rather than the CPU count because the work is I/O-bound.
+    semaphore = asyncio.Semaphore(MAX_SEARCH_WORKERS)
+
+    async def _search(query):
+        async with semaphore:
+            return await _run_blocking(google_search_tool.invoke, {"query": query})
+
+    # gather() keeps the query order so the filter prompt (and its cache key) is stable across runs
+    for search_results in await asyncio.gather(*(_search(query) for query in search_queries)):
+        for result in search_results:
+            # Overlapping queries return the same pages, drop them before they reach the filter LLM
+            url = result.get("link") or result.get("url")
+            if url:
+                url = canonical_url(url)
+                if url in seen_urls:
+                    continue
+                seen_urls.add(url)
+            all_results.append(result)
     
-    print(f'Résultats de la recherche : ', all_results)
-    print('\n')
+    log.info("--- %d unique search results. ---", len(all_results))
+    log.debug("Résultats de la recherche : %s", all_results)
 
-    return {"raw_search_results": all_results}
+    # The serialized copy belongs to the filtered results, it is rebuilt by the filter node
+    return {"raw_search_results": all_results, "raw_search_results_json": ""}
 
 # Noeud 5
-def filter_search_results_node(state: AgentState):
+async def filter_search_results_node(state: AgentState):
     """
     Filters raw_search_results to include only relevant commercial entities based on ICP and product context.
+    The results are split into chunks that are filtered in parallel with a single batch LLM call.
     """
-    print('-'*50)
-    print("\n--- NODE: Filtering Search Results ---")
-    raw_results = state['raw_search_results']
-
-    # We can pass the full raw results as they are already a list of dicts
-    raw_results_str = json.dumps(raw_results, indent=2)
-
-    response_content = llm.invoke(filter_search_results_prompt.format_messages(
-                                                                       raw_search_results=raw_results_str,
-                                                                       product_context=state['product_context'],
-                                                                       icp=state['icp'])).content
-    llm_output = remove_json_blocks(response_content)
-    try:
-        filtered_results_list = json.loads(llm_output)
-        
-        print(f"--- Successfully filtered to {len(filtered_results_list)} relevant search results. ---")
-        # Overwrite raw_search_results with the filtered ones for the next step
-        return {"raw_search_results": filtered_results_list} 
-    except json.JSONDecodeError:
-        print(f"--- ERROR: Failed to parse filtered results JSON: {response_content} ---")
-        return {"raw_search_results": []}
+    if not state.get('raw_search_results'):
+        return {"raw_search_results": [], "raw_search_results_json": "[]"}
+
+    log.info("--- NODE: Filtering Search Results ---")
+    # Drop the results that mention none of the ICP keywords before paying for the LLM filter
+    raw_results = prefilter_results(
+        state['raw_search_results'], icp_keywords(state['icp'], state.get('company_list') or ())
+    )
+    log.info("--- Pre-filter kept %d/%d results. ---", len(raw_results), len(state['raw_search_results']))
+    # The compact summary keeps the prompts small, fall back to the full ICP
+    icp = state.get('icp_summary') or state['icp']
+
+    # Small chunks keep each prompt well under the context window and let the chunks run concurrently
+    chunks = [raw_results[i:i + FILTER_CHUNK_SIZE] for i in range(0, len(raw_results), FILTER_CHUNK_SIZE)]
+    # The product context and ICP are the same for every chunk, bind them once
+    chunk_prompt = filter_search_results_prompt.partial(product_context=state['product_context'], icp=icp)
+    # Compact JSON: pretty-printing roughly doubles the bytes (and tokens) sent to the model.
+    prompts = [chunk_prompt.format_messages(raw_search_results=orjson.dumps(chunk).decode()) for chunk in chunks]
+    log.info("--- Filtering %d results in %d chunks... ---", len(raw_results), len(prompts))
+    batch_results = await (get_llm() | json_parser).abatch(
+        prompts, config={"max_concurrency": MAX_FILTER_WORKERS}, return_exceptions=True
+    )
+
+    # A chunk that fails to parse is dropped, the other chunks are kept
+    filtered_results_list = []
+    for result in batch_results:
+        if isinstance(result, OutputParserException):
+            log.error("--- ERROR: Failed to parse filtered results JSON: %s ---", result.llm_output)
+            continue
+        if isinstance(result, Exception):
+            raise result
+        if not isinstance(result, list):
+            log.error("--- ERROR: Filtered results JSON is not a list: %s ---", result)
+            continue
+        filtered_results_list.extend(result)
+
+    log.info("--- Successfully filtered to %d relevant search results. ---", len(filtered_results_list))
+    # Overwrite raw_search_results with the filtered ones for the next step, along with
+    # their serialized form so the parsing nodes do not serialize the same list again
+    return {
+        "raw_search_results": filtered_results_list,
+        "raw_search_results_json": orjson.dumps(filtered_results_list).decode()
+    }
 
 # Routeur de stratégie
 def strategy_routing(state):
@@ -241,13 +459,17 @@ def strategy_routing(state):
         return "company_first"
     else:
         # Fallback to prevent None return
-        print(f"Unknown strategy: {strategy_name}, defaulting to person_first")
+        log.warning("Unknown strategy: %s, defaulting to person_first", strategy_name)
         return "person_first"
 
 # New router for the second phase of company_first strategy
 def parsing_routing(state):
     """Decide parsing node based on strategy and whether we have companies already"""
     strategy_name = state.get("strategy", {}).get("strategy_name")
+
+    # Nothing survived the filter: skip the parsing LLM call and go straight to the retry check
+    if not state.get("raw_search_results"):
+        return "no_results"
     
     # If we're in company_first strategy and don't have a company list yet, parse companies
     if strategy_name == "COMPANY_FIRST_LOCAL" and not state.get("company_list"):
@@ -260,133 +482,171 @@ def parsing_routing(state):
         return "parse_llm"
 
 # Noeud 6.A   
-def parse_linkedin_node(state: AgentState):
-    print("\n--- NODE: Parsing Search Results (Python-Based) ---")
+async def parse_linkedin_node(state: AgentState):
+    log.info("--- NODE: Parsing Search Results (Python-Based) ---")
     
     raw_results = state['raw_search_results']
-    print(f"--- Input to parsing tool: {len(raw_results)} raw results ---")
+    log.info("--- Input to parsing tool: %d raw results ---", len(raw_results))
     
     # Debug: Print first result to see structure
     if raw_results:
-        print(f"--- Sample raw result structure: ---")
-        print(raw_results[0])
+        log.debug("--- Sample raw result structure: %s ---", raw_results[0])
     
-    prospects_list = parse_linkedin_search_results.invoke({"search_data": raw_results})
+    prospects_list = await _run_blocking(parse_linkedin_search_results.invoke, {"search_data": raw_results})
     
-    print(f"--- Tool returned {len(prospects_list)} prospects ---")
+    log.info("--- Tool returned %d prospects ---", len(prospects_list))
     if not prospects_list:
-        print("--- WARNING: Tool returned empty list - check tool implementation ---")
+        log.warning("--- WARNING: Tool returned empty list - check tool implementation ---")
     
     return {"prospects": prospects_list}
     
 # Noeud 6.B   
-def parse_llm_node(state: AgentState):
+async def parse_llm_node(state: AgentState):
     """
     Takes the raw_search_results for a company_first strategy and simplifies them, and uses an LLM
     to parse them into a structured list of prospects including the snippet.
     """
-    print("\n--- NODE: Parsing Search Results (LLM-Based) ---")
-    raw_results = state['raw_search_results']
+    if not state.get('raw_search_results'):
+        return {"prospects": []}
+
+    log.info("--- NODE: Parsing Search Results (LLM-Based) ---")
 
     # We can pass the full raw results as they are already a list of dicts
-    simplified_results_str = json.dumps(raw_results, indent=2)
+    simplified_results_str = _serialized_results(state)
+
+    chain = parse_results_prompt | get_llm() | json_parser
 
-    response_content = llm.invoke(parse_results_prompt.format_messages(search_results=simplified_results_str,
-                                                                       product_context=state['product_context'],
-                                                                       icp=state['icp'])).content
-    llm_output = remove_json_blocks(response_content)
     try:
-        prospects_list = json.loads(llm_output)
-        
-        
-        print(f"--- Successfully parsed {len(prospects_list)} prospects. ---")
-        print('\n')
-        for prospect in prospects_list:
-            print(prospect)
-        return {"prospects": prospects_list}
-    except json.JSONDecodeError:
-        print(f"--- ERROR: Failed to parse prospects JSON: {response_content} ---")
+        prospects_list = await chain.ainvoke({"search_results": simplified_results_str})
+    except OutputParserException as e:
+        log.error("--- ERROR: Failed to parse prospects JSON: %s ---", e.llm_output)
+        return {"prospects": []}
+
+    if not isinstance(prospects_list, list):
+        log.error("--- ERROR: Prospects JSON is not a list: %s ---", prospects_list)
         return {"prospects": []}
+
+    for prospect in prospects_list:
+        log.debug("Prospect: %s", prospect)
+    # The next nodes index prospects by url, name and title: drop the items missing them
+    prospects_list, rejected = validate_items(Prospect, prospects_list)
+    if rejected:
+        log.warning("--- WARNING: Dropped %d prospects that do not match the schema ---", rejected)
+    log.info("--- Successfully parsed %d prospects. ---", len(prospects_list))
+    return {"prospects": prospects_list}
         
+# Field accessors of the dedup and personalization loops, looked up in C instead of per-item Python indexing
+_get_url = operator.itemgetter('url')
+_get_prompt_fields = operator.itemgetter('name', 'title', 'url')
+
 # Noeud 7
-def deduplicate_prospects_node(state: AgentState):
-    print("\n--- NODE: Deduplicating Prospects ---")
-    unique_prospects = []
-    seen_urls = set()
-    for prospect in state['prospects']:
-        if prospect['url'] not in seen_urls:
-            unique_prospects.append(prospect)
-            seen_urls.add(prospect['url'])
-    print(f"--- Deduplicated to {len(unique_prospects)} unique prospects. ---")
+async def deduplicate_prospects_node(state: AgentState):
+    log.info("--- NODE: Deduplicating Prospects ---")
+    # A single insertion-ordered dict keyed on the canonical URL: one hash per prospect,
+    # setdefault keeps the first occurrence, and the same profile reached through different
+    # tracking links or hosts (www., trailing slash) is only kept once.
+    prospects_by_url = {}
+    # The no_results route skips the parsing nodes, prospects may not be in the state yet
+    for prospect in state.get('prospects', []):
+        prospects_by_url.setdefault(canonical_url(_get_url(prospect)), prospect)
+    unique_prospects = list(prospects_by_url.values())
+    log.info("--- Deduplicated to %d unique prospects. ---", len(unique_prospects))
     return {"prospects": unique_prospects}
 
 # Noeud 8
-def personalization_node(state: AgentState):
+async def personalization_node(state: AgentState):
     """
-    Generates personalized outreach content by scraping prospect URLs in parallel
-    and then calling the LLM in a single batch operation.
+    Generates personalized outreach content, several prospects per LLM prompt.
+    Each group of prospects is scraped concurrently and sent to the LLM as soon as its own
+    pages are in, so the LLM calls of the first groups overlap the scraping of the others.
     """
-    print('-'*50)
-    print("\n--- NODE: Generating Personalized Outreach (Optimized) ---")
+    if not state.get('prospects'):
+        return {"personalized_outreach": []}
+
+    log.info("--- NODE: Generating Personalized Outreach (Optimized) ---")
     prospects = state['prospects']
-    product_context = state['product_context']
-    
-    print(f"--- Researching {len(prospects)} prospects in parallel... ---")
-    
-    # We use a ThreadPoolExecutor to run the scrape_webpage_tool on multiple threads.
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        # Create a list of URLs to scrape
-        urls_to_scrape = [prospect['url'] for prospect in prospects]
-        # map() runs the tool for each URL and returns the results in the same order.
-        scraped_contents = list(executor.map(lambda url: scrape_webpage_tool.invoke({"url": url}), urls_to_scrape))
-    
-    print("--- Preparing prompts for batch LLM call... ---")
-    all_prompts = []
-    for i, prospect in enumerate(prospects):
-        # Match the scraped content to the correct prospect
-        researched_content = scraped_contents[i]
-        
-        # If scraping failed for a prospect, we can skip them or use a default.
-        if "Error fetching URL" in researched_content:
-            print(f"--- WARNING: Skipping personalization for {prospect['name']} due to scraping error. ---")
-            continue
 
-        # Format the prompt with the successfully scraped content
-        prompt = personalization_prompt.format_messages(
-            product_context=product_context, 
-            prospect_name=prospect['name'],
-            prospect_title=prospect['title'],
-            prospect_url=prospect['url'],
-            researched_content=researched_content
-        )
-        all_prompts.append(prompt)
-
-    # --- Step 3: Execute a single batch LLM call ---
-    print(f"--- Executing batch LLM call for {len(all_prompts)} prompts... ---")
-    batch_results = llm.batch(all_prompts)
-    
-    # --- Step 4: Process the results ---
-    outreach_list = []
-    for i, result in enumerate(batch_results):
-        llm_output = remove_json_blocks(result.content)
-        
-        # We need to find the original prospect that this result corresponds to
-        original_prospect = prospects[i] 
-        
-        try:
-            recommendations = json.loads(llm_output)
-            outreach_list.append({
-                "prospect": original_prospect,
+    log.info("--- Researching %d prospects in parallel... ---", len(prospects))
+
+    # The scrapes and the LLM calls are each bounded by their own semaphore
+    scrape_semaphore = asyncio.Semaphore(MAX_SCRAPE_CONCURRENCY)
+    llm_semaphore = asyncio.Semaphore(MAX_PERSONALIZATION_WORKERS)
+    # The product context is the same for every prompt, bind it once
+    batch_prompt = personalization_batch_prompt.partial(product_context=state['product_context'])
+    chain = get_llm() | json_parser
+
+    async def _scrape(url):
+        async with scrape_semaphore:
+            return await _scrape_cached(url)
+
+    async def _personalize(group):
+        """Scrapes a group of prospects, then writes their openers with a single prompt."""
+        # gather() returns the contents in the same order as the prospects
+        scraped_contents = await asyncio.gather(*map(_scrape, map(_get_url, group)))
+
+        researched_prospects = []
+        prompt_rows = []
+        for prospect, researched_content in zip(group, scraped_contents):
+            # If scraping failed for a prospect, we skip them.
+            if "Error fetching URL" in researched_content:
+                log.warning("--- WARNING: Skipping personalization for %s due to scraping error. ---", prospect['name'])
+                continue
+            # The position in these lists is the id the LLM uses to refer to the prospect
+            researched_prospects.append(prospect)
+            name, title, url = _get_prompt_fields(prospect)
+            prompt_rows.append({
+                "id": len(prompt_rows),
+                "name": name,
+                "title": title,
+                "url": url,
+                "researched_content": researched_content
+            })
+        if not prompt_rows:
+            return []
+
+        async with llm_semaphore:
+            try:
+                results = await chain.ainvoke(batch_prompt.format_messages(prospects=orjson.dumps(prompt_rows).decode()))
+            except OutputParserException:
+                # The whole group is lost, its prospects are reported as failures below
+                results = []
+
+        # Answers missing a field are dropped, the others are matched back to the prospects by id
+        results, rejected = validate_items(ProspectRecommendations, results if isinstance(results, list) else [])
+        if rejected:
+            log.warning("--- WARNING: Dropped %d recommendations that do not match the schema ---", rejected)
+        recommendations_by_id = {result.pop("id"): result for result in results}
+
+        outreach = []
+        for prospect_id, prospect in enumerate(researched_prospects):
+            recommendations = recommendations_by_id.get(prospect_id)
+            if recommendations is None:
+                log.error("--- ERROR: Failed to parse personalization for %s ---", prospect['name'])
+                continue
+            outreach.append({
+                "prospect": prospect,
                 "recommendations": recommendations
             })
-        except json.JSONDecodeError:
-            print(f"--- ERROR: Failed to parse personalization for {original_prospect['name']} ---")
-            
-    print(f"--- Successfully generated {len(outreach_list)} personalized outreach messages. ---")
+        return outreach
+
+    # The groups follow the prospect order, so the prompts (and their cache keys) do not
+    # depend on which page happens to load first.
+    groups = [
+        prospects[i:i + PERSONALIZATION_BATCH_SIZE]
+        for i in range(0, len(prospects), PERSONALIZATION_BATCH_SIZE)
+    ]
+    log.info("--- Personalizing %d prospects in %d prompts... ---", len(prospects), len(groups))
+    outreach_list = [
+        outreach
+        for group_outreach in await asyncio.gather(*(_personalize(group) for group in groups))
+        for outreach in group_outreach
+    ]
+
+    log.info("--- Successfully generated %d personalized outreach messages. ---", len(outreach_list))
     return {"personalized_outreach": outreach_list}
 
 # Noeud 9
-def prepare_for_retry_node(state: AgentState):
+async def prepare_for_retry_node(state: AgentState):
     """Updates the error_message in the state to guide the next query generation attempt."""
     error_message = "The previous set of search queries did not yield any viable prospects after filtering. Please generate a new and different set of queries, perhaps by targeting adjacent industries or using broader keywords."
     return {"error_message": error_message}
@@ -394,16 +654,17 @@ def prepare_for_retry_node(state: AgentState):
 # Routeur d'erreurs
 def should_continue_or_retry(state: AgentState):
     """Router to decide whether to continue, retry the search, or end the process."""
-    if len(state['prospects']) > 0:
-        print(f"--- {len(state['prospects'])} prospects found. Proceeding to personalization. ---")
+    prospects = state.get('prospects', [])
+    if len(prospects) > 0:
+        log.info("--- %d prospects found. Proceeding to personalization. ---", len(prospects))
         return "continue"
     else:
         # Check if we have exceeded the max number of retries
         if state.get('search_attempts', 0) >= 3:
-            print("--- MAX SEARCH ATTEMPTS REACHED. ENDING RUN. ---")
+            log.info("--- MAX SEARCH ATTEMPTS REACHED. ENDING RUN. ---")
             return "end"
         else:
-            print("--- NO PROSPECTS FOUND. RETRYING SEARCH. ---")
+            log.info("--- NO PROSPECTS FOUND. RETRYING SEARCH. ---")
             return "retry"
 
 workflow = StateGraph(AgentState)
@@ -448,7 +709,8 @@ workflow.add_conditional_edges(
     {
         "parse_linkedin": "parse_linkedin_node",
         "parse_llm": "parse_llm_node", 
-        "parse_companies": "parse_companies_node"
+        "parse_companies": "parse_companies_node",
+        "no_results": "deduplicate_prospects_node"
     }
 )
 
@@ -475,45 +737,47 @@ workflow.add_edge("prepare_for_retry_node", "generate_company_search_queries_nod
 workflow.add_edge("personalization_node", END)
 
 
-# Compile the agent
+# Compiled graph referenced by langgraph.json ("./agent.py:agent"). The LangGraph API server
+# reads it from the module namespace, so it has to be a plain attribute. Compiling is cheap,
+# the LLM clients and caches are still only created on first use.
 agent = workflow.compile()
 
-# Invoke with product_context extracted from human message
-# human_message_content = "Je suis une créatrice de 52 ans à Pontchâteau, Loire-Atlantique, France, et je réalise de magnifiques pièces de décoration : attrape-rêves, créations en macramé et ojo de dios. Pour le marcramé, je vends de la décoration, porte-plantes, sacs, ceintures, accessoires, porte-clés, etc... Je travaille également sur commande pour tout type de pièces originales. J’expose déjà dans une boutique, et je suis ouvert à plus de canaux de ventes."
-human_message_content = "I am a starting Freelance, 28 years old. I live in France and speak English really well. I'd like to focus on US clients. I can dev websites, web apps, and most of all can offer AI, Agents and automation services. Never had a client yet. My stack : Langgraph, LLM APis, React, FastAPI, Next JS, but also Data Science : Plotly, Pandas, Scikit learn and more. I'd like to find clients that can pay for my skills, but I don't know what is the right approach"
-human_message = HumanMessage(content=human_message_content)
-
-# Create initial state with product_context from human message
-initial_state = {
-    "product_context": human_message_content,  # Extract product description from human message
-    "messages": [human_message],
-    "icp": {},
-    "search_queries": {},
-    "company_list": [],
-    "raw_search_results": [],
-    "prospects": [],
-    "personalized_outreach": [],
-    "llm_calls": 0,
-    "search_attempts": 0,
-    "error_message": ""
-
-}
-
-# Invoke the agent
-result = agent.invoke(initial_state)
-
-print('-'*50)
-print('\n')
-for outreach in result['personalized_outreach']:
-    print(json.dumps(outreach, indent=2))
-    print('\n')
-    print('-'*50)
-    print('\n')
-
-
-
-
-
+# Running the pipeline from the command line only: importing this module (langgraph dev,
+# generate_graph.py, a REPL) just builds the graph.
+if __name__ == "__main__":
+    # The progress messages are shown at INFO, set LOG_LEVEL=DEBUG to also see the intermediate data
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+    # Invoke with product_context extracted from human message
+    # human_message_content = "Je suis une créatrice de 52 ans à Pontchâteau, Loire-Atlantique, France, et je réalise de magnifiques pièces de décoration : attrape-rêves, créations en macramé et ojo de dios. Pour le marcramé, je vends de la décoration, porte-plantes, sacs, ceintures, accessoires, porte-clés, etc... Je travaille également sur commande pour tout type de pièces originales. J’expose déjà dans une boutique, et je suis ouvert à plus de canaux de ventes."
+    human_message_content = "I am a starting Freelance, 28 years old. I live in France and speak English really well. I'd like to focus on US clients. I can dev websites, web apps, and most of all can offer AI, Agents and automation services. Never had a client yet. My stack : Langgraph, LLM APis, React, FastAPI, Next JS, but also Data Science : Plotly, Pandas, Scikit learn and more. I'd like to find clients that can pay for my skills, but I don't know what is the right approach"
+    human_message = HumanMessage(content=human_message_content)
+
+    # Create initial state with product_context from human message
+    initial_state = {
+        "product_context": human_message_content,  # Extract product description from human message
+        "messages": [human_message],
+        "icp": {},
+        "icp_summary": "",
+        "search_queries": {},
+        "company_list": [],
+        "raw_search_results": [],
+        "raw_search_results_json": "",
+        "prospects": [],
+        "personalized_outreach": [],
+        "llm_calls": 0,
+        "search_attempts": 0,
+        "error_message": ""
 
+    }
 
+    # Invoke the agent
+    result = asyncio.run(agent.ainvoke(initial_state))
 
+    print('-'*50)
+    print('\n')
+    for outreach in result['personalized_outreach']:
+        print(orjson.dumps(outreach, option=orjson.OPT_INDENT_2).decode())
+        print('\n')
+        print('-'*50)
+        print('\n')
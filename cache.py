@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import math
+import orjson
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+log = logging.getLogger("kvasir.cache")
+
+def _digest(*parts):
+    """Returns a short BLAKE2 digest of the given strings, used as a cache key."""
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+def _remember_bounded(memory, key, value, max_entries):
+    """Stores a value in an insertion-ordered dict, evicting the oldest entry once it is full."""
+    if key not in memory and len(memory) >= max_entries:
+        memory.pop(next(iter(memory)))
+    memory[key] = value
+
+def _normalize(vector):
+    """Scales a vector to unit length, returns None for a zero vector."""
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm:
+        return None
+    return [x / norm for x in vector]
+
+class SemanticCache:
+    """
+    Small in-memory semantic cache.
+
+    Stores (embedding, value) pairs and returns a stored value when a new text
+    embeds close enough (cosine similarity) to a text seen before.
+
+    Args:
+        embeddings: A LangChain Embeddings object used to embed the lookup texts
+        threshold (float): Minimum cosine similarity for a cache hit
+        path (str): Optional JSON file used to keep the entries between runs
+    """
+
+    def __init__(self, embeddings, threshold=0.9, path=None):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.path = path
+        self._entries = []
+        # Embeddings of the texts already seen, keyed by digest: an exact repeat skips the embedding call
+        self._vectors = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                # JSON rather than pickle: a tampered cache file can only hold data, not code
+                with open(path, "rb") as f:
+                    data = orjson.loads(f.read())
+                self._entries = [(vector, value) for vector, value in data["entries"]]
+                self._vectors = dict(data["vectors"])
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                log.warning("--- CACHE: Could not load %s, starting empty: %s ---", path, e)
+
+    async def aembed(self, text):
+        """
+        Embeds and normalizes a text so lookups only need a dot product.
+
+        Returns:
+            list[float] | None: The unit vector, or None if the embedding call failed.
+        """
+        key = _digest(text)
+        if key in self._vectors:
+            return self._vectors[key]
+        try:
+            vector = await self.embeddings.aembed_query(text)
+        except Exception as e:
+            log.warning("--- CACHE: Embedding failed, skipping semantic cache: %s ---", e)
+            return None
+        return self._remember(key, vector)
+
+    def _remember(self, key, vector):
+        """Normalizes a new embedding and keeps it for exact repeats of the same text."""
+        vector = _normalize(vector)
+        if vector is not None:
+            with self._lock:
+                self._vectors[key] = vector
+        return vector
+
+    def lookup(self, vector):
+        """Returns the value stored for the most similar vector above the threshold, or None."""
+        if vector is None:
+            return None
+        best_score, best_value = self.threshold, None
+        with self._lock:
+            entries = list(self._entries)
+        for cached_vector, value in entries:
+            score = sum(a * b for a, b in zip(vector, cached_vector))
+            if score >= best_score:
+                best_score, best_value = score, value
+        return best_value
+
+    def update(self, vector, value):
+        """Stores a value under the given vector."""
+        if vector is None:
+            return
+        with self._lock:
+            self._entries.append((vector, value))
+            if self.path:
+                self._save()
+
+    def _save(self):
+        """Writes the entries to self.path (atomically, through a temporary file)."""
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps({"entries": self._entries, "vectors": self._vectors}))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("--- CACHE: Could not save %s: %s ---", self.path, e)
+
+class PersistentLLMCache(BaseCache):
+    """
+    Exact-match LLM cache stored in SQLite, so deterministic (temperature=0) answers
+    survive between runs.
+
+    Entries are keyed by a BLAKE2 digest of (prompt, llm_string): hashing is far cheaper
+    than an LLM round-trip and keeps the keys small. Recent entries are also kept in memory.
+    The database is only opened on first use, so creating the cache has no side effect.
+
+    Args:
+        path (str): SQLite database file
+        max_memory_entries (int): Number of entries also kept in memory
+    """
+
+    def __init__(self, path, max_memory_entries=1024):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        # key -> generations, insertion-ordered for the eviction
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        """Returns the SQLite connection, opening the database on first use. Called with the lock held."""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            with self._connection:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, generations TEXT)")
+        return self._connection
+
+    def lookup(self, prompt, llm_string):
+        """Returns the cached generations for this prompt and model configuration, or None."""
+        key = _digest(prompt, llm_string)
+        # alookup/aupdate run these methods on executor threads: the memory is only touched under the lock
+        with self._lock:
+            generations = self._memory.get(key)
+            if generations is not None:
+                return generations
+            row = self._connect().execute("SELECT generations FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        # Only the classes the chat model stores are revived
+        generations = loads(row[0], allowed_objects=[ChatGeneration, AIMessage])
+        with self._lock:
+            _remember_bounded(self._memory, key, generations, self.max_memory_entries)
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        """Stores the generations for this prompt and model configuration."""
+        key = _digest(prompt, llm_string)
+        with self._lock:
+            _remember_bounded(self._memory, key, return_val, self.max_memory_entries)
+            connection = self._connect()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?)", (key, dumps(return_val)))
+
+    def clear(self, **kwargs):
+        """Removes every entry."""
+        with self._lock:
+            self._memory.clear()
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM llm_cache")
+
+class PageCache:
+    """
+    Scraped page contents keyed by URL, stored in SQLite and kept for a limited time
+    so pages refetched across runs and retries skip the HTTP round-trip and the parsing.
+
+    Args:
+        path (str): SQLite database file
+        ttl (float): Number of seconds a page stays valid
+        max_memory_entries (int): Number of pages also kept in memory
+    """
+
+    def __init__(self, path, ttl, max_memory_entries=1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        # url -> (fetched_at, content), insertion-ordered for the eviction
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, fetched_at REAL, content TEXT)")
+            # Expired pages are dropped once per process instead of on every lookup
+            self._connection.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - ttl,))
+
+    def get(self, url):
+        """Returns the content stored for this URL if it has not expired, or None."""
+        entry = self._memory.get(url)
+        if entry is None:
+            with self._lock:
+                entry = self._connection.execute("SELECT fetched_at, content FROM pages WHERE url = ?", (url,)).fetchone()
+            if entry is None:
+                return None
+            _remember_bounded(self._memory, url, entry, self.max_memory_entries)
+        fetched_at, content = entry
+        if time.time() - fetched_at > self.ttl:
+            return None
+        return content
+
+    def set(self, url, content):
+        """Stores the content of a page fetched now."""
+        entry = (time.time(), content)
+        _remember_bounded(self._memory, url, entry, self.max_memory_entries)
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", (url, *entry))
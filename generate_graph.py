@@ -3,6 +3,24 @@
 Standalone script to generate LangGraph workflow diagrams.
 Usage: python generate_graph.py
 """
+import hashlib
+import os
+import shutil
+
+# Rendered diagrams are kept here, keyed by a digest of their Mermaid source
+GRAPH_CACHE_DIR = ".cache"
+
+def _save_rendered(img_bytes, filename, cached_path):
+    """Writes the rendered PNG to filename and keeps a copy for the next unchanged graph."""
+    with open(filename, "wb") as f:
+        f.write(img_bytes)
+    if cached_path is None:
+        return
+    try:
+        os.makedirs(GRAPH_CACHE_DIR, exist_ok=True)
+        shutil.copyfile(filename, cached_path)
+    except OSError as e:
+        print(f"--- Could not cache the rendered diagram: {e} ---")
 
 def generate_workflow_graph(agent, filename="agent_graph.png", xray=True):
     """
@@ -16,13 +34,23 @@ def generate_workflow_graph(agent, filename="agent_graph.png", xray=True):
     Returns:
         bool: True if successful, False otherwise
     """
+    # Set once the Mermaid source is known, the fallbacks below may run without it
+    cached_path = None
     try:
+        graph = agent.get_graph(xray=xray)
+        # Rendering takes seconds (remote API or headless browser): skip it when the graph has not changed
+        digest = hashlib.blake2b(graph.draw_mermaid().encode(), digest_size=16).hexdigest()
+        cached_path = os.path.join(GRAPH_CACHE_DIR, f"graph-{digest}.png")
+        if os.path.exists(cached_path):
+            shutil.copyfile(cached_path, filename)
+            print(f"--- Workflow diagram unchanged, saved as {filename} (cached) ---")
+            return True
+
         # Try the API method first (faster if available)
         print("--- Attempting to generate workflow diagram via API... ---")
-        img_bytes = agent.get_graph(xray=xray).draw_mermaid_png()
+        img_bytes = graph.draw_mermaid_png()
         
-        with open(filename, "wb") as f:
-            f.write(img_bytes)
+        _save_rendered(img_bytes, filename, cached_path)
         print(f"--- Workflow diagram saved as {filename} (API method) ---")
         return True
         
@@ -38,8 +66,7 @@ def generate_workflow_graph(agent, filename="agent_graph.png", xray=True):
                 draw_method=MermaidDrawMethod.PYPPETEER
             )
             
-            with open(filename, "wb") as f:
-                f.write(img_bytes)
+            _save_rendered(img_bytes, filename, cached_path)
             print(f"--- Workflow diagram saved as {filename} (Pyppeteer method) ---")
             return True
             
@@ -73,6 +73,20 @@ strategy_selection_prompt = ChatPromptTemplate.from_template(
     """
 )
 
+icp_summary_prompt = ChatPromptTemplate.from_template(
+    """
+    You are a B2B Go-To-Market strategist. Your task is to condense the following Ideal Customer Profile (ICP) into a compact summary that later prospecting steps can use as context.
+
+    **Ideal Customer Profile (ICP):**
+    {icp}
+
+    **Instructions:**
+    - Keep only what is needed to judge whether a company or person is a fit: industries, company size, geography, required technologies and key persona titles.
+    - Use at most 5 short lines of plain text, matching the **Ideal Customer Profile (ICP)** language.
+    - Do not output JSON or markdown, and do not include any other text or explanation.
+    """
+)
+
 generate_queries_prompt = ChatPromptTemplate.from_template(
     """
     You are a lead generation expert who crafts perfect Google search queries.
@@ -164,38 +178,37 @@ parse_results_prompt = ChatPromptTemplate.from_template(
     """
 )
 
-personalization_prompt = ChatPromptTemplate.from_template(
+personalization_batch_prompt = ChatPromptTemplate.from_template(
     """
-    You are a world-class sales development representative fluent in many languages. Your task is to write 3 distinct, hyper-personalized opening lines for a cold email based on deep research. The lines will have to match the language of the **PRODUCT CONTEXT**.
+    You are a world-class sales development representative fluent in many languages. Your task is to write 3 distinct, hyper-personalized opening lines for a cold email to each of the prospects below, based on deep research. The lines will have to match the language of the **PRODUCT CONTEXT**.
 
     **PRODUCT CONTEXT:**
     {product_context}
 
-    **PROSPECT INFORMATION:**
-    - Name: {prospect_name}
-    - Title: {prospect_title}
-    - URL: {prospect_url}
-
-    **RESEARCHED CONTENT FROM THEIR URL:**
+    **PROSPECTS:**
+    A JSON list of prospects. Each one has an `id`, a `name`, a `title`, a `url` and the `researched_content` scraped from their URL.
     ---
-    {researched_content}
+    {prospects}
     ---
 
     **YOUR TASK:**
-    Write 3 unique and compelling opening lines for an email to {prospect_name}. Each opener must be based on a different angle. The tone should be respectful, observant, and focused on providing value to the prospect's business. Do NOT write the full email, only the opening lines.
+    For each prospect, write 3 unique and compelling opening lines for an email to that prospect. Each opener must be based on a different angle. The tone should be respectful, observant, and focused on providing value to the prospect's business. Do NOT write the full email, only the opening lines. Only use the `researched_content` of a prospect for that prospect.
 
     1.  **Angle 1 (The "Shared Vision/Aesthetic" Angle):** Identify a core aesthetic, value, or mission from the `product_context` (e.g., craftsmanship, innovation, sustainability, unique design, problem-solving) and connect it to something specific you observed in the `researched_content` of the prospect's business (e.g., their product selection, brand identity, customer testimonials, recent initiatives).
-    2.  **Angle 2 (The "Strategic Alignment" Angle):** Based on the `product_context` and the `prospect_information`, find a point of strategic or operational relevance. This could be a geographic connection if the product is locally produced, a shared target audience, a complementary product category, or an alignment with their business goals. If the `product_context` mentions a specific location, leverage that for a "local connection" if relevant to the prospect.
+    2.  **Angle 2 (The "Strategic Alignment" Angle):** Based on the `product_context` and the prospect information, find a point of strategic or operational relevance. This could be a geographic connection if the product is locally produced, a shared target audience, a complementary product category, or an alignment with their business goals. If the `product_context` mentions a specific location, leverage that for a "local connection" if relevant to the prospect.
     3.  **Angle 3 (The "Business Impact" Angle):** Frame how the product described in the `product_context` could bring concrete benefits to the prospect's business, such as attracting new customers, enhancing their existing offerings, solving a particular pain point (as inferred from the `researched_content` or general industry knowledge), or increasing revenue/differentiation.
 
-    Output the result as a clean JSON object.
+    Output the result as a clean JSON array with exactly one object per prospect, using the prospect's `id`.
 
     **JSON Schema:**
-    {{
-      "shared_vision_aesthetic": "...",
-      "strategic_alignment": "...",
-      "business_impact": "..."
-    }}
+    [
+      {{
+        "id": 0,
+        "shared_vision_aesthetic": "...",
+        "strategic_alignment": "...",
+        "business_impact": "..."
+      }}
+    ]
     """
 )
 
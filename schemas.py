@@ -0,0 +1,44 @@
+from typing import List
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+# Output schemas of the JSON-emitting prompts, used by the JsonOutputParser of each node.
+
+class Strategy(BaseModel):
+    strategy_name: str
+    rationale: str = ""
+
+class Prospect(BaseModel):
+    # Extra fields the model adds (company...) are kept
+    model_config = ConfigDict(extra="allow")
+
+    name: str
+    title: str = ""
+    url: str
+    snippet: str = ""
+
+class CompanyList(BaseModel):
+    companies: List[str]
+
+class Recommendations(BaseModel):
+    shared_vision_aesthetic: str
+    strategic_alignment: str
+    business_impact: str
+
+class ProspectRecommendations(Recommendations):
+    id: int
+
+def validate_items(model, items):
+    """
+    Validates each parsed JSON item against a schema in one pass per item.
+
+    Returns:
+        tuple[list[dict], int]: The valid items (as plain dicts, with defaults filled in)
+        and the number of items rejected.
+    """
+    valid = []
+    for item in items:
+        try:
+            valid.append(model.model_validate(item).model_dump())
+        except ValidationError:
+            continue
+    return valid, len(items) - len(valid)
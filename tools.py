@@ -1,11 +1,47 @@
 import os
-from langchain_core.tools import tool
-from googleapiclient.discovery import build
+import asyncio
+import logging
+import orjson
+import weakref
+from langchain_core.tools import tool, StructuredTool
 import re
 from typing import Dict, List, Any
 import requests
+from requests.adapters import HTTPAdapter
+import httpx
 from bs4 import BeautifulSoup
 
+log = logging.getLogger("kvasir.tools")
+
+# Custom Search JSON API endpoint
+GOOGLE_CSE_URL = "https://www.googleapis.com/customsearch/v1"
+
+# One HTTP session shared by the search and scraping tools, so connections (DNS + TCP + TLS)
+# are kept alive across calls. The pool is sized for the concurrent fan-out of the agent nodes.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+_SESSION.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+SCRAPE_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+
+# Async HTTP clients used by the async scraping path, one per event loop:
+# pooled connections are bound to the loop that opened them.
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Returns the shared httpx.AsyncClient of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers=SCRAPE_HEADERS,
+            timeout=10,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+        )
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
 @tool
 def google_search_tool(query: str) -> list[dict]:
     """
@@ -13,26 +49,37 @@ def google_search_tool(query: str) -> list[dict]:
     Each result is a dictionary containing 'title', 'link', and 'snippet'.
     Use this to find people, companies, articles, and other information on the public web.
     """
-    print(f"--- TOOL: Searching Google for: '{query}' ---")
+    log.info("--- TOOL: Searching Google for: '%s' ---", query)
     try:
         # Get credentials from environment variables
         api_key = os.environ["GOOGLE_CSE_API_KEY"]
         cse_id = os.environ["GOOGLE_CSE_ID"]
 
-        # Build the service object
-        service = build("customsearch", "v1", developerKey=api_key)
-
-        # Execute the search
+        # Execute the search on the shared session (the googleapiclient service object
+        # is not thread-safe, and building it per call opened a new connection every time)
         # We ask for the top 5 results by setting num=5
-        result = service.cse().list(q=query, cx=cse_id, num=5).execute()
+        response = _SESSION.get(GOOGLE_CSE_URL, params={"key": api_key, "cx": cse_id, "q": query, "num": 5}, timeout=10)
+        response.raise_for_status()
+        # orjson decodes the UTF-8 body bytes directly, without the text decoding pass of response.json()
+        result = orjson.loads(response.content)
 
         # Extract the items or return an empty list if no results
         return result.get("items", [])
 
     except Exception as e:
-        print(f"Error during Google search: {e}")
+        log.error("Error during Google search: %s", e)
         return [{"error": f"An error occurred: {e}"}]
 
+# LinkedIn title and URL patterns, compiled once at import instead of looked up on every result
+_LINKEDIN_SUFFIX_RE = re.compile(r'\s*\|\s*LinkedIn.*$')
+_TITLE_NAME_RE = re.compile(r'^([^-]+?)\s*-\s*')
+_WHITESPACE_RE = re.compile(r'\s+')
+_NAME_FORBIDDEN_CHARS_RE = re.compile(r'[|@#$%^&*()+=\[\]{}\\;:"\',.<>?/`~]')
+_PROFILE_URL_RE = re.compile(r'linkedin\.com/in/([^/?]+)')
+_POSTS_URL_RE = re.compile(r'linkedin\.com/posts/([^_/?]+)')
+_TRAILING_NUMBER_RE = re.compile(r'\s+\d+$')
+_ROLE_SUFFIX_RE = re.compile(r'\s+(Developer|Engineer|Manager|Consultant|Specialist)$', re.IGNORECASE)
+
 def extract_name_from_linkedin_title(title_string: str) -> str:
     """
     Extracts name from LinkedIn title string.
@@ -42,15 +89,15 @@ def extract_name_from_linkedin_title(title_string: str) -> str:
     - "Adam Janes - Fractional CTO | Building with AI..." -> "Adam Janes"
     """
     # Remove "| LinkedIn" suffix if present
-    title_clean = re.sub(r'\s*\|\s*LinkedIn.*$', '', title_string.strip())
+    title_clean = _LINKEDIN_SUFFIX_RE.sub('', title_string.strip())
     
     # Pattern: Extract everything before the first " - "
-    match = re.search(r'^([^-]+?)\s*-\s*', title_clean)
+    match = _TITLE_NAME_RE.search(title_clean)
     
     if match:
         name = match.group(1).strip()
         # Clean up any remaining artifacts
-        name = re.sub(r'\s+', ' ', name)  # Normalize whitespace
+        name = _WHITESPACE_RE.sub(' ', name)  # Normalize whitespace
         return name
     
     # Fallback: if no dash found, try to extract from beginning
@@ -60,7 +107,7 @@ def extract_name_from_linkedin_title(title_string: str) -> str:
         # Assume first two words are likely the name
         potential_name = ' '.join(words[:2])
         # Basic validation - names shouldn't contain certain characters
-        if not re.search(r'[|@#$%^&*()+=\[\]{}\\;:"\',.<>?/`~]', potential_name):
+        if not _NAME_FORBIDDEN_CHARS_RE.search(potential_name):
             return potential_name
     
     return None
@@ -74,19 +121,19 @@ def extract_name_from_linkedin_url(url: str) -> str:
     - "https://www.linkedin.com/posts/juliaferraioli_..." -> "Julia Ferraioli"
     """
     # Profile URL pattern
-    profile_match = re.search(r'linkedin\.com/in/([^/?]+)', url)
+    profile_match = _PROFILE_URL_RE.search(url)
     if profile_match:
         username = profile_match.group(1)
         # Convert username to readable name (replace dashes with spaces, capitalize)
         name = username.replace('-', ' ').title()
         # Remove numbers at the end (LinkedIn adds random numbers)
-        name = re.sub(r'\s+\d+$', '', name)
+        name = _TRAILING_NUMBER_RE.sub('', name)
         # Remove common suffixes that aren't part of names
-        name = re.sub(r'\s+(Developer|Engineer|Manager|Consultant|Specialist)$', '', name, flags=re.IGNORECASE)
+        name = _ROLE_SUFFIX_RE.sub('', name)
         return name
     
     # Posts URL pattern - extract the poster's username
-    posts_match = re.search(r'linkedin\.com/posts/([^_/?]+)', url)
+    posts_match = _POSTS_URL_RE.search(url)
     if posts_match:
         username = posts_match.group(1)
         # Convert username to readable name - handle camelCase usernames
@@ -156,31 +203,59 @@ def parse_linkedin_search_results(search_data: List[Dict[str, Any]]) -> List[Dic
                 })
     return results
 
-@tool
-def scrape_webpage_tool(url: str) -> str:
+# Tags whose content is never readable text
+STRIPPED_TAGS = ('script', 'style')
+# Maximum number of characters kept from a scraped page
+MAX_PAGE_CHARS = 4000
+
+def _extract_clean_text(html: str) -> str:
+    """Turns an HTML page into clean text, truncated to MAX_PAGE_CHARS characters."""
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # A simple way to get clean text from a webpage
+    for script_or_style in soup(STRIPPED_TAGS):
+        script_or_style.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    clean_text = '\n'.join(chunk for chunk in chunks if chunk)
+    
+    # Return the first characters only to avoid huge token counts
+    return clean_text[:MAX_PAGE_CHARS]
+
+def scrape_webpage(url: str) -> str:
     """
     Fetches the clean text content from a given URL.
     Use this to get the content of a LinkedIn profile, a blog post,
     or a news article for personalization research.
     """
-    print(f"--- TOOL: Scraping URL: '{url}' ---")
+    log.info("--- TOOL: Scraping URL: '%s' ---", url)
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _SESSION.get(url, headers=SCRAPE_HEADERS, timeout=10)
         response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # A simple way to get clean text from a webpage
-        for script_or_style in soup(['script', 'style']):
-            script_or_style.decompose()
-        text = soup.get_text()
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        clean_text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        # Return the first 4000 characters to avoid huge token counts
-        return clean_text[:4000]
+        return _extract_clean_text(response.text)
         
     except requests.RequestException as e:
-        return f"Error fetching URL: {e}"
\ No newline at end of file
+        return f"Error fetching URL: {e}"
+
+async def ascrape_webpage(url: str) -> str:
+    """Async version of scrape_webpage(), built on the shared httpx.AsyncClient."""
+    log.info("--- TOOL: Scraping URL: '%s' ---", url)
+    try:
+        # The download runs on the event loop, so many scrapes share one thread
+        response = await _get_async_client().get(url)
+        response.raise_for_status()
+        
+    # InvalidURL (a malformed URL written by the LLM) is not an HTTPError
+    except (httpx.HTTPError, httpx.InvalidURL) as e:
+        return f"Error fetching URL: {e}"
+
+    # HTML parsing is CPU work, keep it off the event loop
+    return await asyncio.to_thread(_extract_clean_text, response.text)
+
+# Sync callers use requests, async callers (the agent nodes) use httpx
+scrape_webpage_tool = StructuredTool.from_function(
+    func=scrape_webpage,
+    coroutine=ascrape_webpage,
+    name="scrape_webpage_tool"
+)
@@ -1,14 +1,143 @@
-import json
+import functools
+import orjson
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Markdown code fences (```json / ```) opening or closing a line, indented or not, compiled once at import
+_JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.MULTILINE)
+
+# Query parameters that only track the click and never change the page (plus every utm_* one)
+TRACKING_QUERY_PARAMS = {"trk", "trkinfo", "gclid", "fbclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+# ICP fields whose words are expected to show up in a relevant search result
+KEYWORD_ICP_FIELDS = ("industries", "geography", "required", "preferred", "title", "department")
+# Keywords are cut to this many letters, so "engineering" also matches "engineer"
+KEYWORD_STEM_LENGTH = 6
+# Fields of a search result scanned by the pre-filter
+SEARCH_RESULT_TEXT_FIELDS = ("title", "snippet", "link", "url")
 
 def remove_json_blocks(text):
     """
     Simple version that removes common JSON code block patterns.
-    
+
     Args:
         text (str or dict): The input string containing JSON code blocks
-        
+
     Returns:
         str: The cleaned string with code block markers removed.
     """
-    text = text.replace('```json', '').replace('```', '')
-    return text.strip()
+    # Most answers have no fence at all: a substring search (a C memchr-style scan) skips the regex
+    if "```" not in text:
+        return text.strip()
+    return _JSON_FENCE_RE.sub('', text).strip()
+
+def canonical_url(url):
+    """
+    Normalizes a URL so the same page is recognized under its different spellings:
+    lowercase host without "www.", no fragment, no tracking parameters, no trailing slash.
+
+    Args:
+        url (str): The URL to normalize
+
+    Returns:
+        str: The canonical URL, used as a deduplication key. A URL that cannot be parsed
+        (e.g. "http://[::1") is returned as is, it still works as a key.
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode([
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not (key.lower().startswith("utm_") or key.lower() in TRACKING_QUERY_PARAMS)
+    ])
+    return urlunsplit((parts.scheme.lower(), host, parts.path.rstrip("/"), query, ""))
+
+def icp_keywords(icp, companies=()):
+    """
+    Extracts the keywords a relevant search result is expected to contain: the industries,
+    geography, technologies and persona titles of the ICP, and the target company names.
+
+    Args:
+        icp (str or dict): The ICP, as generated (a JSON string) or already parsed
+        companies (list[str]): Target company names, if any
+
+    Returns:
+        set[str]: Lowercased keyword stems, empty if the ICP cannot be parsed.
+    """
+    try:
+        icp_data = orjson.loads(icp) if isinstance(icp, str) else icp
+    except orjson.JSONDecodeError:
+        return set()
+
+    phrases = list(companies)
+    pending = [(None, icp_data)]
+    while pending:
+        key, value = pending.pop()
+        if isinstance(value, dict):
+            pending.extend(value.items())
+        elif isinstance(value, list):
+            pending.extend((key, item) for item in value)
+        elif isinstance(value, str) and key in KEYWORD_ICP_FIELDS:
+            phrases.append(value)
+
+    keywords = set()
+    for phrase in phrases:
+        for word in re.findall(r"\w+", phrase):
+            # Short words are only kept as acronyms (CTO, VP, AWS): "and", "des"... would match anything
+            if len(word) >= 4 or word.isupper():
+                keywords.add(word.lower()[:KEYWORD_STEM_LENGTH])
+    return keywords
+
+def _trie_regex(words):
+    """
+    Builds a regex matching any of the words, factored as a prefix trie:
+    {"sales", "saas", "cto"} gives "(?:cto|sa(?:as|les))". The regex engine then follows a
+    single branch per letter instead of trying every keyword at every position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def _build(node):
+        # A keyword is a prefix match, so nothing after the end of a shorter keyword matters
+        if "" in node:
+            return ""
+        branches = [re.escape(char) + _build(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return _build(trie)
+
+@functools.lru_cache(maxsize=32)
+def _keyword_pattern(keywords):
+    """Compiles the pre-filter pattern once per keyword set (the retry loop reuses the same ICP)."""
+    return re.compile(r"\b" + _trie_regex(keywords), re.IGNORECASE)
+
+def prefilter_results(results, keywords):
+    """
+    Cheap lexical pass run before the LLM filter: keeps the search results mentioning
+    at least one keyword (at the start of a word, case-insensitive).
+
+    Args:
+        results (list[dict]): Search results
+        keywords (set[str]): Keywords from icp_keywords()
+
+    Returns:
+        list[dict]: The matching results. All the results if there are no keywords or
+        nothing matches, the pre-filter must never leave the LLM with nothing to judge.
+    """
+    if not keywords:
+        return results
+    # All the keywords are matched in a single scan of each result
+    pattern = _keyword_pattern(frozenset(keywords))
+    kept = [
+        result for result in results
+        if pattern.search(" ".join(str(result.get(field, "")) for field in SEARCH_RESULT_TEXT_FIELDS))
+    ]
+    return kept or results